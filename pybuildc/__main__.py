@@ -0,0 +1,3 @@
+from pybuildc.main import main
+
+main()
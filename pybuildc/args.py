@@ -1,18 +1,28 @@
 from pathlib import Path
-from typing import Protocol
+from typing import Literal, Protocol
 import argparse
 
 from pybuildc.__version__ import __version__
-from pybuildc.types import Action, Bin, Mode
+from pybuildc.types import Action, Bin
 
 
 class ArgsConfig(Protocol):
     action: Action
     dir: Path
-    mode: Mode
+    mode: str
+    modes: list[str]
+    jobs: int | None
+    load: float | None
     build_dir: Path | None
     bin: Bin
     exe: str | None
+    generator: Literal["ninja"]
+    daemon: bool
+    idle: float
+    stop: bool
+    workers: list[str]
+    host: str
+    port: int | None
     cflags: list[str]
 
 
@@ -23,10 +33,37 @@ def args_parse(argv: list[str]) -> tuple[ArgsConfig, list[str]]:
         epilog="",
     )
     parser.add_argument("-d", "--dir", type=Path, default=Path.cwd())
-    parser.add_argument("-bd", "--build-dir")
-    parser.add_argument("-m", "--mode", choices=("debug", "release"), default="debug")
+    parser.add_argument("-bd", "--build-dir", type=Path)
+    parser.add_argument(
+        "-m",
+        "--mode",
+        dest="modes",
+        type=lambda modes: modes.split(","),
+        default=["debug"],
+        help="comma separated list of modes to build",
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=None)
+    parser.add_argument(
+        "-l",
+        "--load-average",
+        dest="load",
+        type=float,
+        default=None,
+        help="don't start new jobs while the load average is above this",
+    )
     parser.add_argument("--version", action="version", version=__version__)
     parser.add_argument("--cflags", default=tuple())
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="run the action in the background daemon of the project",
+    )
+    parser.add_argument(
+        "--workers",
+        type=lambda workers: workers.split(","),
+        default=[],
+        help="comma separated list of 'host:port' of workers that compile the sources",
+    )
 
     subparser = parser.add_subparsers(dest="action", required=True)
 
@@ -38,6 +75,17 @@ def args_parse(argv: list[str]) -> tuple[ArgsConfig, list[str]]:
     run = subparser.add_parser("run")
     run.add_argument("-e", "--exe", default=None)
 
+    generate = subparser.add_parser("generate")
+    generate.add_argument("generator", choices=("ninja",))
+
+    daemon = subparser.add_parser("daemon")
+    daemon.add_argument("--idle", type=float, default=600.0)
+    daemon.add_argument("--stop", action="store_true")
+
+    worker = subparser.add_parser("worker")
+    worker.add_argument("--host", default="127.0.0.1")
+    worker.add_argument("--port", type=int, default=None)
+
     test = subparser.add_parser("test")
     test.add_argument("-e", "--exe", default=None)
 
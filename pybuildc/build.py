@@ -1,23 +1,47 @@
+from collections.abc import Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
 import json
+import os
 from pathlib import Path
 import subprocess
+import sys
 from pybuildc.context import Context
 from pybuildc.compiler import Compiler
-import os
+from pybuildc.jobs import jobs_call, jobs_run
+from pybuildc.types import Cmd
 import platform
 
 
-def _build_library(context: Context, cc: Compiler) -> tuple[Path, bool]:
-    # Build scripts
+def _run_scripts(context: Context) -> None:
     if "scripts" in context.config and "build" in context.config["scripts"]:
-        cwd = Path.cwd()
-        os.chdir(context.files.project)
         for script in context.config["scripts"]["build"]:
             try:
-                subprocess.run([script["cmd"], *script["args"]])
+                jobs_call(
+                    (script["cmd"], *script["args"]), cwd=context.files.project
+                )
             except FileNotFoundError:
                 print(f"'{script['cmd']}' not found!")
-        os.chdir(cwd)
+
+
+def _compile(
+    context: Context, cc: Compiler, compile: Sequence[tuple[Path, Path]]
+) -> Iterator[Path]:
+    # The workers are only imported with '--workers' (see main.py)
+    if "pybuildc.worker" in sys.modules:
+        from pybuildc.worker import workers_run
+
+        return workers_run(cc, compile, context.cache.memory)
+    return jobs_run(
+        tuple((src, cc.compile_obj(src, obj)) for obj, src in compile),
+        context.cache.memory,
+    )
+
+
+def _build_library(
+    context: Context, cc: Compiler, scripts: bool = True
+) -> tuple[Path, bool]:
+    if scripts:
+        _run_scripts(context)
 
     rebuild = context.files.config in context.cache
     for dep in context.dependencies:
@@ -26,10 +50,7 @@ def _build_library(context: Context, cc: Compiler) -> tuple[Path, bool]:
 
     name = context.config["pybuildc"]["name"]
 
-    obj_files = tuple(
-        context.files.build / "obj" / f.relative_to(context.files.src).with_suffix(".o")
-        for f in context.files.src_files
-    )
+    obj_files = tuple(context.files.obj(f) for f in context.files.src_files)
 
     compile = tuple(
         (obj, src)
@@ -37,26 +58,31 @@ def _build_library(context: Context, cc: Compiler) -> tuple[Path, bool]:
         if rebuild or src in context.cache
     )
 
-    library = context.files.lib / (
-        f"{name}.lib" if platform.system() == "Windows" else f"lib{name}.a"
-    )
+    library = context.files.library(name)
     if rebuild or compile:
         rebuild = True
-        print(f"[pybuildc] building '{name}'")
-        for n, (obj, src) in enumerate(compile):
-            print(f"  [{(n)/len(compile):5.0%} ]: compiling '{src}'")
-            subprocess.run(cc.compile_obj(src, obj), check=True)
+        print(f"[pybuildc] building '{name}' ({context.args.mode})")
+        for n, src in enumerate(_compile(context, cc, compile), start=1):
+            print(f"  [{n/(len(compile) + 1):5.0%} ]: compiled '{src}'")
         print(f"  [ 100% ]: compiling '{library}'")
-        subprocess.run(cc.compile_lib(obj_files, library), check=True)
+        jobs_call(cc.compile_lib(obj_files, library), check=True)
 
     return library, rebuild
 
 
-def build(context: Context) -> bool:
+def build(context: Context, scripts: bool = True) -> bool:
     cc = Compiler(context, ["-fPIC"] if "dll" in context.config else None)
-    library, compile = _build_library(context, cc)
+    library, compile = _build_library(context, cc, scripts)
 
-    rebuild = False
+    binaries: list[tuple[Path, Cmd]] = []
+    packages: list[tuple[Path, Cmd]] = []
+
+    def package(out: Path) -> None:
+        dwp = cc.package_debug(out)
+        if dwp is not None:
+            # A package left from an earlier build would be reported as new
+            Path(f"{out}.dwp").unlink(missing_ok=True)
+            packages.append((out, dwp))
 
     if "exe" in context.config:
         for name, file in context.config["exe"].items():
@@ -64,12 +90,11 @@ def build(context: Context) -> bool:
                 name += ".exe"
             bin = context.files.project / file
             if compile or bin in context.cache:
-                rebuild = True
                 print(f"  [{name}] '{bin}'")
-                subprocess.run(
-                    cc.compile_exe(bin, library, context.files.bin / name),
-                    check=True,
+                binaries.append(
+                    (bin, cc.compile_exe(bin, library, context.files.bin / name))
                 )
+                package(context.files.bin / name)
 
     if "dll" in context.config:
         for name, file in context.config["dll"].items():
@@ -80,14 +105,33 @@ def build(context: Context) -> bool:
 
             bin = context.files.project / file
             if compile or bin in context.cache:
-                rebuild = True
                 print(f"  [{name}] '{bin}'")
-                subprocess.run(
-                    cc.compile_dll(bin, library, context.files.bin / name),
-                    check=True,
+                binaries.append(
+                    (bin, cc.compile_dll(bin, library, context.files.bin / name))
                 )
+                package(context.files.bin / name)
 
-    return compile or rebuild
+    for _ in jobs_run(binaries, context.cache.memory):
+        pass
+    for out in jobs_run(packages):
+        # The dwp tools write nothing if the binary has no .dwo files
+        if Path(f"{out}.dwp").exists():
+            print(f"  [dwp] '{out}.dwp'")
+
+    return compile or bool(binaries)
+
+
+def build_modes(contexts: list[Context]) -> bool:
+    """Builds all modes concurrently, their compile jobs share one pool
+
+    The build scripts run once before, every mode builds in the same project
+    directory and scripts generating files would race with each other.
+    """
+    _run_scripts(contexts[0])
+    with ThreadPoolExecutor(len(contexts)) as modes:
+        return any(
+            tuple(modes.map(lambda context: build(context, False), contexts))
+        )
 
 
 def run(context: Context, argv: list[str]) -> None:
@@ -135,13 +179,15 @@ def test(context: Context) -> None:
 
     if context.args.exe == None:
         # Compile and run all the tests
-        for bin, out in zip(bin_files, out_files):
-            if compile or bin in context.cache:
-                print(f"  [building] test: '{bin}'")
-                subprocess.run(
-                    cc.compile_exe(bin, library, out),
-                    check=True,
-                )
+        for bin in jobs_run(
+            tuple(
+                (bin, cc.compile_exe(bin, library, out))
+                for bin, out in zip(bin_files, out_files)
+                if compile or bin in context.cache
+            ),
+            context.cache.memory,
+        ):
+            print(f"  [building] test: '{bin}'")
 
         for bin, out in zip(bin_files, out_files):
             if subprocess.run([out]).returncode != 0:
@@ -158,7 +204,7 @@ def test(context: Context) -> None:
             bin, out = test_files[context.args.exe]
             if compile or bin in context.cache:
                 print(f"  [building] test: '{bin}'")
-                subprocess.run(
+                jobs_call(
                     cc.compile_exe(bin, library, out),
                     check=True,
                 )
@@ -174,20 +220,23 @@ def test(context: Context) -> None:
 def build_commands(context: Context) -> None:
     cc = Compiler(context)
 
-    (context.files.project / ".build" / "compile_commands.json").write_text(
-        json.dumps(
-            [
-                {
-                    "file": str(src),
-                    "arguments": cc.compile_obj(src, src.with_suffix(".o")),
-                    "directory": str(context.files.project.absolute()),
-                }
-                for src in context.files.src_files
-                + tuple(
-                    context.files.project / files
-                    for _, files in context.config.get("exe", {}).items()
-                )
-                + context.files.test_files
-            ]
-        )
+    commands = json.dumps(
+        [
+            {
+                "file": str(src),
+                "arguments": cc.compile_obj(src, src.with_suffix(".o")),
+                # The paths are relative to where pybuildc was started
+                "directory": os.getcwd(),
+            }
+            for src in context.files.src_files
+            + tuple(
+                context.files.project / files
+                for _, files in context.config.get("exe", {}).items()
+            )
+            + context.files.test_files
+        ]
     )
+    filename = context.files.project / ".build" / "compile_commands.json"
+    # Rewriting it would make language servers reload it after every build
+    if not filename.exists() or filename.read_text() != commands:
+        filename.write_text(commands)
@@ -1,33 +1,51 @@
 from collections import defaultdict
-import pickle
+from dataclasses import dataclass, field
+import hashlib
 from pathlib import Path
 from typing import Literal
 
 from pybuildc.types import Action
 from pybuildc.files import Files
+from pybuildc.store import Store, store_load, store_save
 
 DepTree = dict[Path, list[Path]]
+# mtime in ns, content hash and the names of the quoted includes
+Scan = tuple[int, int, list[str]]
+
+
+@dataclass
+class Includes:
+    deps: DepTree
+    include_dirs: tuple[Path, ...] = ()
+    # Files with includes that could not be resolved are always rebuilt
+    unresolved: set[Path] = field(default_factory=set)
+    scans: dict[Path, Scan] = field(default_factory=dict)
+    # Direct includes, resolved again on every load
+    direct: dict[Path, list[Path]] = field(default_factory=dict)
 
 
 class Cache:
-    def __init__(self, files: Files, filename: Path, include_dirs: tuple[Path, ...]):
+    def __init__(
+        self, files: Files, filename: Path, action: str, includes: Includes, store: Store
+    ):
         self.filename = filename
-        self.cache: set[Path] = set()
-        self.deps = self.dependency_tree(files, include_dirs)
-        self.file_m_times = (
-            pickle.loads(filename.read_bytes()) if filename.exists() else dict()
-        )
+        self.action = action
+        self.store = store
+        self.cache: set[Path] = set(includes.unresolved)
+        self.includes = includes
+        self.deps = includes.deps
+        # Peak memory of compiling each file, shared by all actions
+        self.memory: dict[Path, int] = store.peaks()
 
+        # Only changed contents count, touching a file does not rebuild it
+        seen = store.seen(action)
         self.cache.update(
             {
                 f
                 for f in files.all_files
-                if self.file_m_times.get(f, 0) < f.stat().st_mtime
-                or any(
-                    (
-                        self.file_m_times.get(include, 0) < include.stat().st_mtime
-                        for include in self.deps[f]
-                    )
+                if any(
+                    seen.get(str(include), 0) != includes.scans[include][1]
+                    for include in (f, *self.deps[f])
                 )
             }
         )
@@ -35,53 +53,116 @@ class Cache:
     def __contains__(self, key) -> bool:
         return key in self.cache
 
+    def _changed(self, seen: dict[str, int]) -> bool:
+        stored = self.store.seen(self.action)
+        return (
+            seen != {p: h for p, h in stored.items() if h or p in seen}
+            or self.memory != self.store.peaks()
+            or any(
+                self.store.scan(f, scan[0]) is None
+                for f, scan in self.includes.scans.items()
+            )
+        )
+
     def save(self):
-        file_m_times = {}
-        for file, files in self.deps.items():
-            file_m_times[file] = file.stat().st_mtime
-            file_m_times.update({f: f.stat().st_mtime for f in files})
-        self.filename.write_bytes(pickle.dumps(file_m_times))
-
-    def _get_dep_of_file(
-        self, file: Path, include_dirs: tuple[Path, ...]
-    ) -> list[Path]:
-        l = list()
-        in_comment: bool = False
-        with file.open(encoding="utf-8") as f:
-            for line in f.readlines():
-                if "/*" in line:
-                    in_comment = True
-                elif "*/" in line:
-                    in_comment = False
-                elif (
-                    not in_comment
-                    and line.startswith("#include")
-                    and line.count('"') == 2
-                ):
-                    idx = line.index('"') + 1
-                    include = line[idx : line.index('"', idx)]
-                    if include != file.name:
-                        for includes in (*include_dirs, file.parent):
-                            include_file = includes / include
-                            if include_file.exists():
-                                l.append(include_file)
-                                l.extend(
-                                    self._get_dep_of_file(include_file, include_dirs)
-                                )
-                                break
-                        else:
-                            self.cache.add(file)
-        return l
-
-    def dependency_tree(self, files: Files, include_dirs: tuple[Path, ...]) -> DepTree:
-        deps: DepTree = defaultdict(list)
-        for file in files.all_files:
-            deps[file] = self._get_dep_of_file(file, include_dirs)
-
-        return deps
+        scans = self.includes.scans
+        seen = {str(f): scan[1] for f, scan in scans.items()}
+        # Builds with nothing to do leave the cache untouched
+        if not self._changed(seen):
+            return
+        actions = {action: self.store.seen(action) for action in self.store.actions}
+        actions[self.action] = seen
+        store_save(self.filename, scans, self.memory, actions)
+
+
+# Scans of every file, kept for the lifetime of the process and only redone
+# when the file changes (see daemon.py)
+_scans: dict[Path, Scan] = {}
+
+
+def _scan_file(file: Path, store: Store) -> Scan:
+    """Hashes the file and collects the names of its quoted includes"""
+    mtime = file.stat().st_mtime_ns
+    cached = _scans.get(file)
+    if cached is not None and cached[0] == mtime:
+        return cached
+    stored = store.scan(file, mtime)
+    if stored is not None:
+        _scans[file] = (mtime, *stored)
+        return _scans[file]
+
+    data = file.read_bytes()
+    l = list()
+    in_comment: bool = False
+    for line in data.decode("utf-8").splitlines():
+        if "/*" in line:
+            in_comment = True
+        elif "*/" in line:
+            in_comment = False
+        elif (
+            not in_comment
+            and line.startswith("#include")
+            and line.count('"') == 2
+        ):
+            idx = line.index('"') + 1
+            include = line[idx : line.index('"', idx)]
+            if include != file.name:
+                l.append(include)
+    digest = hashlib.blake2b(data, digest_size=8).digest()
+    _scans[file] = (mtime, int.from_bytes(digest, "little"), l)
+    return _scans[file]
+
+
+def _resolve(file: Path, includes: Includes, store: Store) -> list[Path]:
+    """Finds the files of the includes, headers may have been added or removed"""
+    if file in includes.direct:
+        return includes.direct[file]
+    scan = includes.scans.get(file)
+    if scan is None:
+        scan = includes.scans[file] = _scan_file(file, store)
+    l = includes.direct[file] = list()
+    for include in scan[2]:
+        for dir in (*includes.include_dirs, file.parent):
+            include_file = dir / include
+            if include_file.exists():
+                l.append(include_file)
+                break
+        else:
+            includes.unresolved.add(file)
+    return l
+
+
+def _get_dep_of_file(file: Path, includes: Includes, store: Store) -> list[Path]:
+    l = list()
+    for include_file in _resolve(file, includes, store):
+        l.append(include_file)
+        l.extend(_get_dep_of_file(include_file, includes, store))
+    return l
+
+
+def includes_load(
+    files: Files, include_dirs: tuple[Path, ...], store: Store | None = None
+) -> Includes:
+    includes = Includes(defaultdict(list), include_dirs)
+    for file in files.all_files:
+        includes.deps[file] = _get_dep_of_file(file, includes, store or Store())
+
+    return includes
 
 
 def cache_load(
-    files: Files, include_dirs: tuple[Path, ...], action: Action | Literal["shared"]
+    files: Files,
+    include_dirs: tuple[Path, ...],
+    action: Action | Literal["shared"],
+    includes: Includes | None = None,
 ) -> Cache:
-    return Cache(files, files.build / f"{action}.pck", include_dirs)
+    """Loads the cache of the build directory, one file shared by all actions"""
+    filename = files.build / "cache"
+    store = store_load(filename)
+    return Cache(
+        files,
+        filename,
+        action,
+        includes if includes else includes_load(files, include_dirs, store),
+        store,
+    )
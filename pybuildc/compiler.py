@@ -1,18 +1,20 @@
 from collections.abc import Iterable
 from pathlib import Path
-import shutil
 import platform
+from typing import get_args
 
+from pybuildc.config import DebugInfo, ModeConfig
 from pybuildc.context import Context
+from pybuildc.tools import tool_find
 
 from pybuildc.types import Cmd
 
 
 class Compiler:
     def __init__(self, context: Context, cflags: list[str] | None = None):
-        if shutil.which("gcc"):
+        if tool_find("gcc"):
             self.cc = "gcc"
-        elif shutil.which("clang"):
+        elif tool_find("clang"):
             self.cc = "clang"
         else:
             raise Exception("No compiler found: install 'gcc' or 'clang'")
@@ -34,15 +36,60 @@ class Compiler:
         )
 
         self.cflags: list[str] = cflags or []
-        self.cflags.extend(
-            ("-g",) if context.args.mode == "debug" else ("-O2", "-DNDEBUG")
+        mode: ModeConfig | dict = context.config.get("mode", {}).get(
+            context.args.mode, {}
         )
+        debug = mode.get("base", context.args.mode) == "debug"
+        if debug:
+            self.debug_info = _debug_info(
+                mode.get(
+                    "debug_info", context.config["pybuildc"].get("debug_info", ())
+                )
+            )
+        else:
+            # Release modes only get debug info if the mode asks for it
+            self.debug_info = _debug_info(mode.get("debug_info", ()))
+            self.cflags.extend(("-O2", "-DNDEBUG"))
+
+        self.dwp: str | None = None
+        if "dwp" in self.debug_info:
+            if tool_find("llvm-dwp"):
+                self.dwp = "llvm-dwp"
+            elif tool_find("dwp"):
+                self.dwp = "dwp"
+            else:
+                raise Exception("No dwp tool found: install 'binutils' or 'llvm'")
+
+        if debug or self.debug_info:
+            self.cflags.extend(self._debug_flags())
+        self.cflags.extend(mode.get("cflags", ()))
         self.cflags.extend(context.args.cflags)
         self.cflags.extend(context.config["pybuildc"].get("cflags", ()))
 
         if platform.system() == "Windows" and "-fPIC" in self.cflags:
             self.cflags.remove("-fPIC")
 
+    def _debug_flags(self) -> tuple[str, ...]:
+        flags: tuple[str, ...] = (
+            ("-gline-tables-only" if self.cc == "clang" else "-g1",)
+            if "line-tables-only" in self.debug_info
+            else ("-g",)
+        )
+        if self.debug_info & {"split", "dwp"}:
+            # The .dwo files are written next to the objects in 'build/obj'
+            flags += ("-gsplit-dwarf",)
+        if self.dwp == "dwp":
+            # The dwp of binutils only reads DWARF 4
+            flags += ("-gdwarf-4",)
+        if "compressed" in self.debug_info:
+            flags += ("-gz",)
+        return flags
+
+    def _link_flags(self) -> list[str]:
+        # Sources compiled and linked in one go would leave their .dwo files
+        # next to the binary, they keep their debug info inline instead
+        return [f for f in self.cflags if f != "-gsplit-dwarf"]
+
     def compile_obj(self, infile: Path, outfile: Path) -> Cmd:
         return (
             self.cc,
@@ -54,13 +101,22 @@ class Compiler:
             str(infile),
         )
 
+    def preprocess_obj(self, infile: Path, outfile: Path) -> Cmd:
+        """Only runs the preprocessor of 'compile_obj'"""
+        *cmd, _, src = self.compile_obj(infile, outfile)
+        return (*cmd, "-E", src)
+
+    def compile_preprocessed(self) -> Cmd:
+        """Compiler and flags of 'compile_obj' for the output of 'preprocess_obj'"""
+        return (self.cc, *self.cflags)
+
     def compile_dll(self, src: Path, library: Path, outfile: Path) -> Cmd:
         if "-fPIC" in self.cflags:
             self.cflags.remove("-fPIC")
         return (
             self.cc,
             *self.includes,
-            *self.cflags,
+            *self._link_flags(),
             "-shared",
             "-o",
             str(outfile),
@@ -74,7 +130,7 @@ class Compiler:
         return (
             self.cc,
             *self.includes,
-            *self.cflags,
+            *self._link_flags(),
             "-o",
             str(outfile),
             str(src),
@@ -84,8 +140,24 @@ class Compiler:
         )
 
     def compile_lib(self, obj_files: Iterable[Path], library: Path) -> Cmd:
-        if shutil.which("ar"):
+        if tool_find("ar"):
             return ("ar", "rcs", str(library), *map(str, obj_files))
-        elif shutil.which("lib"):
+        elif tool_find("lib"):
             return ("lib", f"/OUT:{library}", *map(str, obj_files))
         raise Exception("No library tool found")
+
+    def package_debug(self, binary: Path) -> Cmd | None:
+        """Packs the .dwo files of the binary into '<binary>.dwp' if enabled"""
+        if self.dwp is None:
+            return None
+        return (self.dwp, "-e", str(binary), "-o", f"{binary}.dwp")
+
+
+def _debug_info(options: DebugInfo | Iterable[DebugInfo]) -> set[DebugInfo]:
+    options = {options} if isinstance(options, str) else set(options)
+    unknown = options - set(get_args(DebugInfo))
+    if unknown:
+        raise Exception(
+            f"unknown debug_info {sorted(unknown)}: use {', '.join(get_args(DebugInfo))}"
+        )
+    return options
@@ -1,3 +1,4 @@
+from copy import deepcopy
 from pathlib import Path
 from typing import Literal, TypedDict
 
@@ -5,15 +6,18 @@ import tomllib
 
 from pybuildc.types import Mode
 
+DebugInfo = Literal["split", "compressed", "line-tables-only", "dwp"]
+
 
 class Project(TypedDict):
     name: str
     cflags: list[str]
+    debug_info: DebugInfo | list[DebugInfo]
 
 
 class DepConfig(TypedDict):
     type: Literal["pybuildc", "static"]
-    mode: Mode
+    mode: str
     dir: str
     L: Path
     l: str
@@ -21,6 +25,12 @@ class DepConfig(TypedDict):
     cflags: list[str]
 
 
+class ModeConfig(TypedDict):
+    base: Mode
+    cflags: list[str]
+    debug_info: DebugInfo | list[DebugInfo]
+
+
 class Cmd(TypedDict):
     cmd: str
     args: list[str]
@@ -36,7 +46,16 @@ class Config(TypedDict):
     scripts: Scripts
     exe: dict[str, str]
     dll: dict[str, str]
+    mode: dict[str, ModeConfig]
+
+
+# Parsed configs stay loaded for the lifetime of the process (see daemon.py)
+_configs: dict[Path, tuple[int, dict]] = {}
 
 
 def config_load(filename: Path) -> Config:
-    return Config(**tomllib.loads(filename.read_text()))  # type: ignore
+    mtime = filename.stat().st_mtime_ns
+    if filename not in _configs or _configs[filename][0] != mtime:
+        _configs[filename] = (mtime, tomllib.loads(filename.read_text()))
+    # Callers modify the config so every call gets its own copy
+    return Config(**deepcopy(_configs[filename][1]))  # type: ignore
@@ -1,11 +1,12 @@
+from copy import copy
 from dataclasses import dataclass
 from contextlib import contextmanager
 
 
 from pybuildc.args import ArgsConfig
-from pybuildc.cache import Cache, cache_load
+from pybuildc.cache import Cache, Includes, cache_load
 from pybuildc.config import Config, config_load
-from pybuildc.files import Files, files_load
+from pybuildc.files import Files, Sources, files_load, sources_load
 from pybuildc.dependency import Dependency, dependencies_load
 
 
@@ -18,28 +19,64 @@ class Context:
     args: ArgsConfig
 
 
-@contextmanager
-def context_load(args: ArgsConfig):
-    config = config_load(args.dir / "pybuildc.toml")
+def _context_create(
+    args: ArgsConfig,
+    config: Config,
+    sources: Sources | None = None,
+    includes: Includes | None = None,
+) -> Context:
     files = files_load(
         args.dir,
         args.mode,
         list(config.get("exe", {}).values()),
         build=args.build_dir,
+        sources=sources,
     )
-    dependencies = dependencies_load(files, config.get("libs", {}))
+    dependencies = dependencies_load(files, dict(config.get("libs", {})))
     cache = cache_load(
         files,
         sum((d.include for d in dependencies), (args.dir / "src",)),
         args.action,
+        includes,
     )
 
-    context = Context(
+    return Context(
         config=config,
         files=files,
         dependencies=dependencies,
         cache=cache,
         args=args,
     )
+
+
+@contextmanager
+def context_load(args: ArgsConfig):
+    context = _context_create(args, config_load(args.dir / "pybuildc.toml"))
     yield context
     context.cache.save()
+
+
+@contextmanager
+def contexts_load(args: ArgsConfig):
+    """Loads a context for every mode, sharing the source scan and include graph"""
+    config = config_load(args.dir / "pybuildc.toml")
+    for mode in args.modes:
+        if mode not in ("debug", "release") and mode not in config.get("mode", {}):
+            raise Exception(f"mode '{mode}' is not defined in '{args.dir}'")
+
+    sources = sources_load(args.dir, list(config.get("exe", {}).values()))
+    includes: Includes | None = None
+    contexts: list[Context] = []
+    for mode in args.modes:
+        mode_args = copy(args)
+        mode_args.mode = mode
+        if args.build_dir and len(args.modes) > 1:
+            mode_args.build_dir = args.build_dir / mode
+
+        context = _context_create(mode_args, config, sources, includes)
+        includes = context.cache.includes
+        contexts.append(context)
+
+    yield contexts
+    for context in contexts:
+        context.cache.save()
@@ -0,0 +1,193 @@
+from collections.abc import Callable
+import hashlib
+import json
+import os
+from pathlib import Path
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+# Seconds the client waits for a freshly started daemon
+STARTUP_TIMEOUT = 5.0
+
+
+def _socket_dir() -> Path:
+    """Directory of the sockets that only the user can create files in"""
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    dir = (
+        Path(runtime) / "pybuildc"
+        if runtime
+        else Path(tempfile.gettempdir()) / f"pybuildc-{os.getuid()}"
+    )
+    try:
+        dir.mkdir(mode=0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(dir)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise Exception(f"'{dir}' is not a private directory of the user")
+    return dir
+
+
+def daemon_socket(dir: Path) -> Path:
+    """Every project root gets its own daemon"""
+    digest = hashlib.sha1(str(dir.resolve()).encode()).hexdigest()[:16]
+    return _socket_dir() / f"{digest}.sock"
+
+
+def _send(conn: socket.socket, message: dict, fds: list[int] | None = None) -> None:
+    data = json.dumps(message).encode() + b"\n"
+    if fds:
+        socket.send_fds(conn, [data], fds)
+    else:
+        conn.sendall(data)
+
+
+def _recv(conn: socket.socket) -> tuple[dict, list[int]]:
+    data, fds, _, _ = socket.recv_fds(conn, 1 << 16, 3)
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(1 << 16)
+        if not chunk:
+            raise ConnectionError("pybuildc daemon closed the connection")
+        data += chunk
+    return json.loads(data), fds
+
+
+def _connect(path: Path) -> socket.socket | None:
+    try:
+        if os.lstat(path).st_uid != os.getuid():
+            raise Exception(f"'{path}' belongs to another user")
+    except FileNotFoundError:
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(str(path))
+    except (FileNotFoundError, ConnectionRefusedError):
+        conn.close()
+        return None
+    return conn
+
+
+def daemon_request(dir: Path, argv: list[str]) -> int:
+    """Runs argv in the daemon of the project, the daemon is started if needed
+
+    The daemon borrows stdin, stdout and stderr of this process, so the
+    output of the compilers and of 'run' arrives here directly.
+    """
+    path = daemon_socket(dir)
+    conn = _connect(path)
+    if conn is None:
+        subprocess.Popen(
+            (sys.executable, "-m", "pybuildc", "-d", str(dir.resolve()), "daemon"),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while conn is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+            conn = _connect(path)
+        if conn is None:
+            raise Exception(f"pybuildc daemon did not start: '{path}'")
+
+    with conn:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Compilers, scripts and programs run with the environment of the client
+        env = dict(os.environ)
+        # A pipe style jobserver can not be shared, its fds only exist here
+        if "--jobserver-auth=fifo:" not in env.get("MAKEFLAGS", ""):
+            env.pop("MAKEFLAGS", None)
+        _send(conn, {"argv": argv, "cwd": os.getcwd(), "env": env}, [0, 1, 2])
+        response, _ = _recv(conn)
+    return response["returncode"]
+
+
+def daemon_stop(dir: Path) -> None:
+    conn = _connect(daemon_socket(dir))
+    if conn is None:
+        print("[pybuildc] daemon is not running")
+        return
+    with conn:
+        _send(conn, {"stop": True})
+        _recv(conn)
+
+
+def _handle(request: dict, fds: list[int], run: Callable[[list[str]], int]) -> int:
+    """Runs a request with the stdio of the client"""
+    cwd = os.getcwd()
+    environ = dict(os.environ)
+    saved = [os.dup(fd) for fd in (0, 1, 2)]
+    try:
+        for fd, client in zip((0, 1, 2), fds):
+            os.dup2(client, fd)
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        return run(request["argv"])
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else 0 if e.code is None else 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, save in zip((0, 1, 2), saved):
+            os.dup2(save, fd)
+            os.close(save)
+        for fd in fds:
+            os.close(fd)
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+
+
+def daemon_serve(dir: Path, idle: float, run: Callable[[list[str]], int]) -> None:
+    """Serves requests until 'idle' seconds pass without one
+
+    Loaded configs, source walks and include graphs stay in memory between
+    requests and are revalidated against file and directory mtimes.
+    """
+    path = daemon_socket(dir)
+    sys.stdout.reconfigure(line_buffering=True)  # type: ignore
+
+    running = _connect(path)
+    if running is not None:
+        running.close()
+        return
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        path.unlink(missing_ok=True)
+        server.bind(str(path))
+        path.chmod(0o600)
+        server.listen()
+        server.settimeout(idle)
+        try:
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except TimeoutError:
+                    break
+                with conn:
+                    conn.settimeout(None)
+                    try:
+                        request, fds = _recv(conn)
+                        if request.get("stop"):
+                            _send(conn, {"returncode": 0})
+                            break
+                        _send(conn, {"returncode": _handle(request, fds, run)})
+                    except (OSError, ValueError):
+                        # The client went away, keep serving the others
+                        continue
+        finally:
+            path.unlink(missing_ok=True)
@@ -6,6 +6,7 @@ from typing import Protocol
 from pybuildc.args import ArgsConfig
 from pybuildc.files import Files, files_load
 from pybuildc.config import DepConfig, config_load
+from pybuildc.types import Action
 
 
 class Dependency(Protocol):
@@ -114,20 +115,27 @@ class Pybuildc(Dependency):
             (),
         )
 
-    def build(self):
-        from pybuildc.build import build
+    def context(self, action: Action = "build"):
         from pybuildc.context import context_load
 
         class Args(ArgsConfig):
-            action = "build"
             dir = self.dir
             mode = self.config.get("mode", "release")
+            modes = [mode]
+            jobs = None
+            load = None
             build_dir = self.build_dir
             bin = "static"
             exe = None
             cflags = list(self.cflags)
 
-        with context_load(Args) as context:  # type: ignore
+        Args.action = action
+        return context_load(Args)  # type: ignore
+
+    def build(self):
+        from pybuildc.build import build
+
+        with self.context() as context:
             return build(context)
 
 
@@ -1,8 +1,16 @@
 from dataclasses import dataclass
+from fnmatch import fnmatchcase
 from pathlib import Path
 import itertools
+import os
+import platform
 
-from pybuildc.types import Mode
+
+@dataclass
+class Sources:
+    src_files: tuple[Path, ...]
+    test_files: tuple[Path, ...]
+    all_files: tuple[Path, ...]
 
 
 @dataclass
@@ -37,26 +45,83 @@ class Files:
             )
         return self
 
+    def obj(self, src: Path) -> Path:
+        return self.build / "obj" / src.relative_to(self.src).with_suffix(".o")
+
+    def library(self, name: str) -> Path:
+        return self.lib / (
+            f"{name}.lib" if platform.system() == "Windows" else f"lib{name}.a"
+        )
+
+
+def _stamp(dir: Path) -> int:
+    try:
+        return dir.stat().st_mtime_ns
+    except FileNotFoundError:
+        return -1
+
+
+def _walk(root: Path, stamps: dict[Path, int]) -> list[Path]:
+    """Lists all files below root and records the mtime of every directory"""
+    stamps[root] = _stamp(root)
+    files: list[Path] = []
+    for dir, dirs, names in os.walk(root):
+        for d in dirs:
+            stamps[Path(dir, d)] = _stamp(Path(dir, d))
+        files.extend(Path(dir, name) for name in names)
+    return files
+
+
+# Walks stay valid as long as no directory changed (see daemon.py)
+_sources: dict[tuple[Path, tuple[str, ...]], tuple[dict[Path, int], Sources]] = {}
+
+
+def sources_load(dir: Path, exe_files: list[str]) -> Sources:
+    key = (dir, tuple(exe_files))
+    if key in _sources and all(
+        _stamp(d) == mtime for d, mtime in _sources[key][0].items()
+    ):
+        return _sources[key][1]
 
-def files_load(dir: Path, mode: Mode, exe_files: list[str], build: Path | None = None):
+    stamps: dict[Path, int] = {}
+    src = _walk(dir / "src", stamps)
+    tests = _walk(dir / "tests", stamps)
+    sources = Sources(
+        src_files=tuple(
+            f for f in src if fnmatchcase(f.name, "*.c") and "bin" not in f.parts
+        ),
+        test_files=tuple(f for f in tests if fnmatchcase(f.name, "*-test.c")),
+        all_files=tuple(
+            itertools.chain(
+                (f for f in tests if fnmatchcase(f.name, "*.[c|h]")),
+                (f for f in src if fnmatchcase(f.name, "*.c")),
+                (dir / "pybuildc.toml",),
+                map(lambda f: dir / f, exe_files),
+            )
+        ),
+    )
+    _sources[key] = (stamps, sources)
+    return sources
+
+
+def files_load(
+    dir: Path,
+    mode: str,
+    exe_files: list[str],
+    build: Path | None = None,
+    sources: Sources | None = None,
+):
     build = build if build else dir / ".build" / mode
-    config = dir / "pybuildc.toml"
+    sources = sources if sources else sources_load(dir, exe_files)
     return Files(
-        config=config,
+        config=dir / "pybuildc.toml",
         project=dir,
         bin=build / "bin",
         lib=build / "lib",
         build=build,
         src=dir / "src",
         test=dir / "tests",
-        src_files=tuple(f for f in (dir / "src").rglob("*.c") if "bin" not in f.parts),
-        test_files=tuple((dir / "tests").rglob("*-test.c")),
-        all_files=tuple(
-            itertools.chain(
-                (dir / "tests").rglob("*.[c|h]"),
-                (dir / "src").rglob("*.c"),
-                (config,),
-                map(lambda f: dir / f, exe_files),
-            )
-        ),
+        src_files=sources.src_files,
+        test_files=sources.test_files,
+        all_files=sources.all_files,
     ).ensure()
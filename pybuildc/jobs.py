@@ -0,0 +1,146 @@
+from collections.abc import Iterator, MutableMapping, Sequence
+from concurrent.futures import FIRST_EXCEPTION, Future, ThreadPoolExecutor, wait
+import os
+import subprocess
+import sys
+import threading
+from typing import TypeVar
+
+from pybuildc.jobserver import Jobserver, Slots, jobserver_load
+from pybuildc.resources import load_average, memory_available, memory_used
+from pybuildc.types import Cmd
+
+T = TypeVar("T")
+
+# Seconds between checks of memory and load while jobs are held back
+POLL_INTERVAL = 0.25
+
+_executor: ThreadPoolExecutor | None = None
+_jobserver: Jobserver | Slots | None = None
+_max_load: float = float("inf")
+
+# Expected peak memory and process of every running job
+_running: dict[object, tuple[int, subprocess.Popen | None]] = {}
+_resources = threading.Condition()
+
+
+def jobs_init(jobs: int | None = None, load: float | None = None) -> None:
+    """Creates the pool shared by every context and dependency of this process"""
+    global _executor, _jobserver, _max_load
+    if _executor is not None:
+        _executor.shutdown()
+    if _jobserver is not None:
+        _jobserver.close()
+    _jobserver, jobs = jobserver_load(jobs)
+    _executor = ThreadPoolExecutor(jobs)
+    _max_load = load if load else 2.0 * (os.cpu_count() or 1)
+
+
+def _jobserver_get() -> Jobserver | Slots:
+    if _jobserver is None:
+        jobs_init()
+    assert _jobserver is not None
+    return _jobserver
+
+
+def _admit(memory: int) -> bool:
+    """Checks if a job with the expected peak memory can start right now"""
+    if not _running:
+        return True
+
+    load = load_average()
+    if load is not None and load >= _max_load:
+        return False
+
+    available = memory_available()
+    if available is None or memory == 0:
+        return True
+    # Running jobs have not reached their peak yet, reserve what is left of it
+    reserved = sum(
+        max(0, peak - (memory_used(proc.pid) if proc else 0))
+        for peak, proc in _running.values()
+    )
+    return memory <= available - reserved
+
+
+def _execute(cmd: Cmd, memory: int = 0, check: bool = False, **kwargs) -> int:
+    """Runs a command once the machine has room for it and returns its peak memory"""
+    jobserver = _jobserver_get()
+    job = object()
+    with _resources:
+        while not _admit(memory):
+            _resources.wait(POLL_INTERVAL)
+        _running[job] = (memory, None)
+
+    if jobserver.makeflags is not None:
+        kwargs["env"] = dict(os.environ, MAKEFLAGS=jobserver.makeflags)
+    if jobserver.fds:
+        kwargs["pass_fds"] = jobserver.fds
+
+    token = jobserver.acquire()
+    try:
+        with subprocess.Popen(cmd, **kwargs) as proc:
+            with _resources:
+                _running[job] = (memory, proc)
+            if hasattr(os, "wait4"):
+                _, status, usage = os.wait4(proc.pid, 0)
+                proc.returncode = os.waitstatus_to_exitcode(status)
+                peak = usage.ru_maxrss // (1024 if sys.platform == "darwin" else 1)
+            else:
+                proc.wait()
+                peak = 0
+    finally:
+        jobserver.release(token)
+        with _resources:
+            del _running[job]
+            _resources.notify_all()
+
+    if check and proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+    return peak
+
+
+def jobs_call(cmd: Cmd, **kwargs) -> None:
+    """Runs a single command in the calling thread once a job slot is free"""
+    _execute(cmd, **kwargs)
+
+
+def jobs_run(
+    jobs: Sequence[tuple[T, Cmd]], memory: MutableMapping[T, int] | None = None
+) -> Iterator[T]:
+    """Runs all commands in the shared pool and yields their keys as they finish
+
+    'memory' holds the peak memory of every key from previous runs. The
+    heaviest jobs start first so they do not end up as the tail of the build,
+    and the mapping is updated with the peaks of this run.
+    """
+    _jobserver_get()
+    assert _executor is not None
+    memory = memory if memory is not None else {}
+
+    def job(key: T, cmd: Cmd) -> T:
+        memory[key] = _execute(cmd, memory.get(key, 0), check=True)
+        return key
+
+    yield from jobs_wait(
+        [
+            _executor.submit(job, key, cmd)
+            for key, cmd in sorted(
+                jobs, key=lambda j: memory.get(j[0], 0), reverse=True
+            )
+        ]
+    )
+
+
+def jobs_wait(futures: Sequence[Future[T]]) -> Iterator[T]:
+    """Yields the results as they finish, the first failure cancels the rest"""
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_EXCEPTION)
+        for future in done:
+            if future.exception() is not None:
+                for p in pending:
+                    p.cancel()
+                wait(pending)
+                future.result()
+            yield future.result()
@@ -0,0 +1,160 @@
+import os
+import re
+import select
+import threading
+
+
+class Jobserver:
+    """GNU make jobserver limiting how many jobs run at once
+
+    Every job takes a token before it starts and returns it when it is done.
+    The first job uses the implicit token every make job owns. The same
+    jobserver is handed to the children through 'MAKEFLAGS', so 'make' in
+    build scripts and 'gcc -flto=jobserver' share the limit.
+    """
+
+    def __init__(self, read: int, write: int, makeflags: str, fds: tuple[int, ...]):
+        self.read = read
+        self.write = write
+        self.makeflags = makeflags
+        self.fds = fds
+        # Wakes up threads waiting for a token when the implicit token is free
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        self.owned: tuple[int, ...] = (self._wake_read, self._wake_write)
+        self._implicit = threading.Lock()
+
+    def acquire(self) -> bytes | None:
+        while True:
+            if self._implicit.acquire(blocking=False):
+                return None
+            ready, _, _ = select.select((self.read, self._wake_read), (), ())
+            if self._wake_read in ready:
+                try:
+                    os.read(self._wake_read, 1)
+                except BlockingIOError:
+                    pass
+            if self.read in ready:
+                try:
+                    token = os.read(self.read, 1)
+                except (BlockingIOError, InterruptedError):
+                    # Another process was faster
+                    continue
+                if token:
+                    return token
+
+    def release(self, token: bytes | None) -> None:
+        if token is None:
+            self._implicit.release()
+            try:
+                os.write(self._wake_write, b"+")
+            except BlockingIOError:
+                # Enough wake ups are pending already
+                pass
+        else:
+            os.write(self.write, token)
+
+    def close(self) -> None:
+        for fd in self.owned:
+            os.close(fd)
+
+
+class Slots:
+    """Limits the jobs of this process where there is no jobserver
+
+    Windows can not pass pipes to the children and 'select' does not work on
+    pipes there, so the children do not share the limit.
+    """
+
+    makeflags: str | None = None
+    fds: tuple[int, ...] = ()
+
+    def __init__(self, jobs: int):
+        self._slots = threading.Semaphore(jobs)
+
+    def acquire(self) -> bytes | None:
+        self._slots.acquire()
+        return None
+
+    def release(self, token: bytes | None) -> None:
+        self._slots.release()
+
+    def close(self) -> None:
+        pass
+
+
+def _nonblocking(fd: int) -> int:
+    """Opens a non-blocking read end for a pipe that might be shared with make
+
+    Setting O_NONBLOCK on the inherited fd would change it for make as well.
+    """
+    try:
+        return os.open(f"/proc/self/fd/{fd}", os.O_RDONLY | os.O_NONBLOCK)
+    except OSError:
+        return fd
+
+
+def _jobserver_client(makeflags: str) -> Jobserver | None:
+    """Joins the jobserver of a parent make, supports fifo and pipe style"""
+    auths = re.findall(r"--jobserver-(?:auth|fds)=(\S+)", makeflags)
+    if not auths:
+        return None
+    auth = auths[-1]
+
+    if auth.startswith("fifo:"):
+        try:
+            fd = os.open(auth.removeprefix("fifo:"), os.O_RDWR | os.O_NONBLOCK)
+        except OSError:
+            return None
+        jobserver = Jobserver(fd, fd, makeflags, ())
+        jobserver.owned += (fd,)
+        return jobserver
+
+    match = re.fullmatch(r"(-?\d+),(-?\d+)", auth)
+    if match is None:
+        return None
+    read, write = int(match[1]), int(match[2])
+    try:
+        os.fstat(read)
+        os.fstat(write)
+    except OSError:
+        # make closes the pipe for commands that are not marked with '+'
+        print("[pybuildc] jobserver unavailable, prefix the make rule with '+'")
+        return None
+    jobserver = Jobserver(_nonblocking(read), write, makeflags, (read, write))
+    if jobserver.read != read:
+        jobserver.owned += (jobserver.read,)
+    return jobserver
+
+
+def _jobserver_server(jobs: int, makeflags: str) -> Jobserver:
+    read, write = os.pipe()
+    os.set_blocking(read, False)
+    os.write(write, b"+" * (jobs - 1))
+    makeflags = re.sub(r"(^|\s)-j\d*", "", makeflags).strip()
+    jobserver = Jobserver(
+        read,
+        write,
+        f"{makeflags} -j{jobs} --jobserver-auth={read},{write}".strip(),
+        (read, write),
+    )
+    jobserver.owned += (read, write)
+    return jobserver
+
+
+def jobserver_load(jobs: int | None) -> tuple[Jobserver | Slots, int]:
+    """Returns the jobserver of the parent make or a new one and the job count"""
+    if os.name != "posix":
+        jobs = jobs or os.cpu_count() or 1
+        return Slots(jobs), jobs
+
+    makeflags = os.environ.get("MAKEFLAGS", "")
+    jobserver = _jobserver_client(makeflags)
+    if jobserver is not None:
+        limit = re.findall(r"(?:^|\s)-j(\d+)", makeflags)
+        threads = int(limit[-1]) if limit else os.cpu_count() or 1
+        return jobserver, min(jobs, threads) if jobs else threads
+
+    jobs = jobs or os.cpu_count() or 1
+    return _jobserver_server(jobs, makeflags), jobs
@@ -1,45 +1,101 @@
-import os
-from pathlib import Path
-import subprocess
 import sys
 
-from pybuildc.new import new
 from pybuildc.args import ArgsConfig, args_parse
-from pybuildc.context import context_load
-from pybuildc.build import build, run, test, build_commands
+
+# Modules are imported by the actions that need them, so that '--version',
+# '--daemon' and other cheap invocations do not pay for the whole build system
 
 
 def pybuildc(args: ArgsConfig, argv: list[str]):
+    from pybuildc.context import contexts_load
+
+    if args.action != "new":
+        from pybuildc.jobs import jobs_init
+
+        jobs_init(args.jobs, args.load)
+    # Also resets the workers of an earlier request to the daemon
+    if args.workers or "pybuildc.worker" in sys.modules:
+        from pybuildc.worker import workers_init
+
+        workers_init(args.workers)
     match args.action:
         case "new":
+            from pybuildc.new import new
+
             new(args)
 
         case "build":
-            with context_load(args) as context:
-                build(context)
+            from pybuildc.build import build_modes
+
+            with contexts_load(args) as contexts:
+                build_modes(contexts)
 
         case "run":
-            with context_load(args) as context:
-                run(context, argv)
+            from pybuildc.build import run
+
+            with contexts_load(args) as contexts:
+                for context in contexts:
+                    run(context, argv)
 
         case "test":
-            with context_load(args) as context:
-                test(context)
+            from pybuildc.build import test
+
+            with contexts_load(args) as contexts:
+                for context in contexts:
+                    test(context)
+
+        case "generate":
+            from pybuildc.ninja import generate_ninja
+
+            # ninja runs in the build directory, all paths have to be absolute
+            args.dir = args.dir.absolute()
+            if args.build_dir:
+                args.build_dir = args.build_dir.absolute()
+            with contexts_load(args) as contexts:
+                for context in contexts:
+                    print(f"[pybuildc] generated '{generate_ninja(context)}'")
 
         case action:
             raise Exception(f"{action} is not implemented yet")
 
-    os.chdir(args.dir)
-    args.dir = Path(".")
+    from pybuildc.build import build_commands
+
     args.action = "command"
-    with context_load(args) as context:
-        build_commands(context)
+    args.modes = args.modes[:1]
+    with contexts_load(args) as contexts:
+        build_commands(contexts[0])
 
 
-def main():
-    args, argv = args_parse(sys.argv[1:])
+def _run(args: ArgsConfig, argv: list[str]) -> int:
+    import subprocess
+
     try:
         pybuildc(args, argv)
     except subprocess.CalledProcessError as e:
         failed_cmd = e.args[1]
         print(f"[pybuildc] Error: '{' '.join(map(str, failed_cmd))}'")
+        return 1
+    return 0
+
+
+def main():
+    args, argv = args_parse(sys.argv[1:])
+    if args.action == "daemon":
+        from pybuildc.daemon import daemon_serve, daemon_stop
+
+        if args.stop:
+            daemon_stop(args.dir)
+        else:
+            daemon_serve(args.dir, args.idle, lambda argv: _run(*args_parse(argv)))
+    elif args.action == "worker":
+        from pybuildc.jobs import jobs_init
+        from pybuildc.worker import worker_serve
+
+        jobs_init(args.jobs, args.load)
+        worker_serve(args.host, args.port, args.jobs)
+    elif args.daemon:
+        from pybuildc.daemon import daemon_request
+
+        sys.exit(daemon_request(args.dir, [a for a in sys.argv[1:] if a != "--daemon"]))
+    else:
+        sys.exit(_run(args, argv))
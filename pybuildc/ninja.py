@@ -0,0 +1,154 @@
+from pathlib import Path
+import platform
+import shlex
+import sys
+
+from pybuildc.compiler import Compiler
+from pybuildc.context import Context
+from pybuildc.dependency import Pybuildc
+from pybuildc.types import Cmd
+
+RULES = """\
+rule cc
+  command = $cmd -MMD -MF $out.d
+  description = compiling $in
+  depfile = $out.d
+  deps = gcc
+
+rule link
+  command = $cmd -MMD -MF $out.d
+  description = linking $out
+  depfile = $out.d
+  deps = gcc
+
+rule ar
+  command = $cmd
+  description = archiving $out
+
+rule regen
+  command = $cmd
+  description = regenerating $out
+  generator = 1
+"""
+
+
+def _escape(path: Path) -> str:
+    return str(path).replace("$", "$$").replace(" ", "$ ").replace(":", "$:")
+
+
+def _paths(paths) -> str:
+    return " ".join(map(_escape, paths))
+
+
+def _build(
+    lines: list[str],
+    out: Path,
+    rule: str,
+    inputs: tuple[Path, ...],
+    implicit: tuple[Path, ...] = (),
+    cmd: Cmd | None = None,
+) -> None:
+    line = f"build {_escape(out)}: {rule} {_paths(inputs)}"
+    if implicit:
+        line += f" | {_paths(implicit)}"
+    lines.append(line)
+    if cmd is not None:
+        lines.append(f"  cmd = {shlex.join(cmd).replace('$', '$$')}")
+
+
+def _generate(
+    context: Context, root: bool
+) -> tuple[Path, tuple[Path, ...], tuple[Path, ...]]:
+    """Writes 'build.ninja' into the build directory
+
+    Returns the file, all 'pybuildc.toml' files it was generated from and the
+    libraries of the project and of all its 'pybuildc' dependencies.
+    """
+    files = context.files
+    name = context.config["pybuildc"]["name"]
+    cc = Compiler(context, ["-fPIC"] if "dll" in context.config else None)
+
+    lines = [
+        "# generated by pybuildc from 'pybuildc.toml', do not edit",
+        "ninja_required_version = 1.3",
+        f"builddir = {_escape(files.build)}",
+        "",
+        RULES,
+    ]
+
+    configs: tuple[Path, ...] = (files.config,)
+    libraries: tuple[Path, ...] = ()
+    for dep in context.dependencies:
+        if isinstance(dep, Pybuildc):
+            with dep.context("generate") as dep_context:
+                subninja, dep_configs, dep_libraries = _generate(
+                    dep_context, root=False
+                )
+                lines.append(f"subninja {_escape(subninja)}")
+                configs += dep_configs
+                libraries += dep_libraries
+    lines.append("")
+
+    obj_files = tuple(files.obj(src) for src in files.src_files)
+    for obj, src in zip(obj_files, files.src_files):
+        _build(lines, obj, "cc", (src,), cmd=cc.compile_obj(src, obj))
+
+    library = files.library(name)
+    _build(lines, library, "ar", obj_files, cmd=cc.compile_lib(obj_files, library))
+
+    targets = [library]
+    for name, file in context.config.get("exe", {}).items():
+        out = files.bin / (name + ".exe" if platform.system() == "Windows" else name)
+        src = files.project / file
+        cmd = cc.compile_exe(src, library, out)
+        _build(lines, out, "link", (src,), (library, *libraries), cmd)
+        targets.append(out)
+
+    for name, file in context.config.get("dll", {}).items():
+        out = files.bin / (
+            name + ".dll" if platform.system() == "Windows" else name + ".so"
+        )
+        src = files.project / file
+        cmd = cc.compile_dll(src, library, out)
+        _build(lines, out, "link", (src,), (library, *libraries), cmd)
+        targets.append(out)
+
+    ninja = files.build / "build.ninja"
+    if root:
+        tests = []
+        cc = Compiler(context)
+        for src in files.test_files:
+            rel = src.relative_to(files.test).with_suffix("")
+            out = files.build / files.test.name / rel
+            cmd = cc.compile_exe(src, library, out)
+            _build(lines, out, "link", (src,), (library, *libraries), cmd)
+            tests.append(out)
+        lines.append(f"build tests: phony {_paths(tests)}")
+
+        # Directories change their mtime when source files are added or removed
+        sources = files.src_files + files.test_files
+        dirs = {d for d in (files.src, *(f.parent for f in sources)) if d.is_dir()}
+        regenerate = (
+            sys.executable,
+            "-m",
+            "pybuildc",
+            "-d",
+            str(files.project),
+            "-bd",
+            str(files.build),
+            "-m",
+            context.args.mode,
+            "generate",
+            "ninja",
+        )
+        # ninja only regenerates the manifest if the path matches: 'ninja -C <build>'
+        _build(lines, Path(ninja.name), "regen", configs, tuple(sorted(dirs)), regenerate)
+        lines.append(f"default {_paths(targets)}")
+
+    ninja.write_text("\n".join(lines) + "\n")
+    return ninja, configs, (library, *libraries)
+
+
+def generate_ninja(context: Context) -> Path:
+    """Generates a 'build.ninja' for the context and all 'pybuildc' dependencies"""
+    return _generate(context, root=True)[0]
@@ -0,0 +1,35 @@
+import os
+from pathlib import Path
+
+# All memory sizes are in KiB, like '/proc/meminfo' and 'ru_maxrss' on linux
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") // 1024 if hasattr(os, "sysconf") else 4
+
+
+def memory_available() -> int | None:
+    """Memory that can be used without swapping, None if it is unknown"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def memory_used(pid: int) -> int:
+    """Resident memory of a process and all of its children"""
+    proc = Path("/proc") / str(pid)
+    try:
+        used = int((proc / "statm").read_text().split()[1]) * PAGE_SIZE
+        children = (proc / "task" / str(pid) / "children").read_text().split()
+    except (OSError, IndexError, ValueError):
+        return 0
+    return used + sum(memory_used(int(child)) for child in children)
+
+
+def load_average() -> float | None:
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
@@ -0,0 +1,185 @@
+"""On-disk format of the cache of a build directory
+
+All paths and include names are interned into one table and every other
+section is a flat array indexed by the position of the string in that table:
+
+    header       magic, version, byte order and the section sizes
+    paths        utf-8 strings separated by NUL bytes
+    mtimes       int64  mtime in ns when the file was hashed and scanned
+    hashes       uint64 content hash of the file at that mtime
+    memory       uint32 peak memory in KiB of compiling the file
+    offsets      uint32 start of the includes of every file in 'edges'
+    edges        uint32 names of the quoted includes of all files
+    actions      name and uint64 hashes of every file at the last run
+
+Includes are stored as written in the source and resolved on every run,
+so adding or removing a header is noticed without rescanning anything.
+
+Sections are 8 byte aligned and used as views into the loaded bytes, so
+only the parts that are looked at are ever converted to python objects.
+"""
+from array import array
+from collections.abc import Iterable
+import os
+from pathlib import Path
+import struct
+import sys
+import tempfile
+from typing import Literal
+
+MAGIC = b"PYBC"
+# Increase on every change of the layout, old caches are then ignored
+VERSION = 2
+
+# magic, version, little endian, paths, edges, actions, blob size
+_HEADER = struct.Struct("<4sIIIIIQ")
+_NAME = struct.Struct("<Q")
+
+
+def _pad(size: int) -> int:
+    return -size % 8
+
+
+class Store:
+    def __init__(self, data: bytes = b""):
+        self._clear()
+        if data:
+            try:
+                self._parse(memoryview(data))
+            except (ValueError, TypeError, struct.error, UnicodeDecodeError):
+                # A broken cache only costs a rebuild
+                self._clear()
+
+    def _clear(self) -> None:
+        self.paths: list[str] = []
+        self.index: dict[str, int] = {}
+        self.mtimes = self.hashes = self.memory = memoryview(b"")
+        self.offsets = self.edges = memoryview(b"")
+        self.actions: dict[str, memoryview] = {}
+
+    def _parse(self, data: memoryview) -> None:
+        magic, version, little, n, e, a, blob = _HEADER.unpack_from(data)
+        if (magic, version, little) != (MAGIC, VERSION, sys.byteorder == "little"):
+            return
+        pos = _HEADER.size
+
+        def section(fmt: Literal["B", "I", "q", "Q"], count: int) -> memoryview:
+            nonlocal pos
+            size = struct.calcsize(fmt) * count
+            if pos + size > len(data):
+                raise ValueError("truncated cache")
+            view = data[pos : pos + size].cast(fmt)
+            pos += size + _pad(size)
+            return view
+
+        paths = bytes(section("B", blob)).decode()
+        self.paths = paths.split("\0") if n else []
+        if len(self.paths) != n:
+            raise ValueError("broken path table")
+        self.index = {p: i for i, p in enumerate(self.paths)}
+        self.mtimes = section("q", n)
+        self.hashes = section("Q", n)
+        self.memory = section("I", n)
+        self.offsets = section("I", n + 1)
+        self.edges = section("I", e)
+        for _ in range(a):
+            (size,) = _NAME.unpack_from(data, pos)
+            pos += _NAME.size
+            name = bytes(section("B", size)).decode()
+            self.actions[name] = section("Q", n)
+
+    def scan(self, file: Path, mtime: int) -> tuple[int, list[str]] | None:
+        """Hash and include names of the file, if it did not change since"""
+        i = self.index.get(str(file))
+        if i is None or self.mtimes[i] != mtime:
+            return None
+        names = [
+            self.paths[j] for j in self.edges[self.offsets[i] : self.offsets[i + 1]]
+        ]
+        return self.hashes[i], names
+
+    def seen(self, action: str) -> dict[str, int]:
+        """Hashes of all files at the last successful run of the action"""
+        if action not in self.actions:
+            return {}
+        return dict(zip(self.paths, self.actions[action]))
+
+    def peaks(self) -> dict[Path, int]:
+        return {Path(p): m for p, m in zip(self.paths, self.memory) if m}
+
+
+def store_load(filename: Path) -> Store:
+    try:
+        return Store(filename.read_bytes())
+    except FileNotFoundError:
+        return Store()
+
+
+def store_save(
+    filename: Path,
+    files: dict[Path, tuple[int, int, list[str]]],
+    memory: dict[Path, int],
+    actions: dict[str, dict[str, int]],
+) -> None:
+    """Writes the cache atomically
+
+    'files' maps every file to its mtime, hash and include names. The file
+    is replaced with a rename, so an interrupted build leaves the previous
+    cache intact.
+    """
+    paths = [str(f) for f in files]
+    index = {p: i for i, p in enumerate(paths)}
+    for _, _, names in files.values():
+        for include in names:
+            if include not in index:
+                index[include] = len(paths)
+                paths.append(include)
+    n = len(paths)
+
+    def padded(a: array | bytes) -> bytes:
+        data = a.tobytes() if isinstance(a, array) else a
+        return data + b"\0" * _pad(len(data))
+
+    def column(fmt: str, values: Iterable[int]) -> bytes:
+        a = array(fmt, values)
+        a.extend([0] * (n - len(a)))
+        return padded(a)
+
+    offsets = array("I", [0])
+    edges = array("I")
+    for _, _, names in files.values():
+        edges.extend(index[name] for name in names)
+        offsets.append(len(edges))
+    offsets.extend([len(edges)] * (n + 1 - len(offsets)))
+
+    blob = "\0".join(paths).encode()
+    parts = [
+        _HEADER.pack(
+            MAGIC,
+            VERSION,
+            sys.byteorder == "little",
+            n,
+            len(edges),
+            len(actions),
+            len(blob),
+        ),
+        padded(blob),
+        column("q", (s[0] for s in files.values())),
+        column("Q", (s[1] for s in files.values())),
+        column("I", (memory.get(f, 0) for f in files)),
+        padded(offsets),
+        padded(edges),
+    ]
+    for action, seen in actions.items():
+        name = action.encode()
+        parts.append(_NAME.pack(len(name)) + padded(name))
+        parts.append(column("Q", (seen.get(p, 0) for p in paths)))
+
+    fd, tmp = tempfile.mkstemp(dir=filename.parent, prefix=f".{filename.name}.")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(b"".join(parts))
+        os.replace(tmp, filename)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -0,0 +1,77 @@
+import json
+import os
+from pathlib import Path
+import shutil
+
+# Tools looked up by earlier runs, valid as long as 'PATH' and its directories
+# did not change, installing a tool changes the modification time of its
+# directory. Each tool is also checked against its own modification time.
+CACHE = (
+    Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    / "pybuildc"
+    / "tools.json"
+)
+
+# Keyed by 'PATH' as well, requests to the daemon may come with another one
+_tools: dict[tuple[str, str], str | None] = {}
+_stored: dict[str, dict[str, list]] = {}
+
+
+def _stamps(path: str) -> dict[str, int]:
+    stamps = {}
+    for dir in path.split(os.pathsep):
+        try:
+            stamps[dir] = os.stat(dir).st_mtime_ns
+        except OSError:
+            stamps[dir] = 0
+    return stamps
+
+
+def _load(path: str, stamps: dict[str, int]) -> dict[str, list]:
+    try:
+        data = json.loads(CACHE.read_text())
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get("path") != path:
+        return {}
+    if data.get("dirs") != stamps or not isinstance(data.get("tools"), dict):
+        return {}
+    return data["tools"]
+
+
+def _save(path: str, stamps: dict[str, int], tools: dict[str, list]) -> None:
+    tmp = CACHE.with_name(f".{CACHE.name}.{os.getpid()}")
+    try:
+        CACHE.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(json.dumps({"path": path, "dirs": stamps, "tools": tools}))
+        os.replace(tmp, CACHE)
+    except OSError:
+        # Only a cache, the tools are looked up again next time
+        tmp.unlink(missing_ok=True)
+
+
+def tool_find(name: str) -> str | None:
+    """Full path of the tool like 'shutil.which', cached across runs"""
+    path = os.environ.get("PATH", os.defpath)
+    if (path, name) in _tools:
+        return _tools[(path, name)]
+
+    stamps = _stamps(path)
+    if path not in _stored:
+        _stored[path] = _load(path, stamps)
+    tools = _stored[path]
+
+    stored = tools.get(name)
+    if stored is not None:
+        try:
+            # Tools that were not found are remembered as well
+            if stored[0] is None or os.stat(stored[0]).st_mtime_ns == stored[1]:
+                _tools[(path, name)] = stored[0]
+                return stored[0]
+        except (OSError, TypeError, IndexError):
+            pass
+
+    found = _tools[(path, name)] = shutil.which(name, path=path)
+    tools[name] = [found, os.stat(found).st_mtime_ns if found else 0]
+    _save(path, stamps, tools)
+    return found
@@ -1,7 +1,7 @@
 from typing import Literal
 
 Mode = Literal["debug", "release"]
-Action = Literal["build", "test", "run", "command"]
+Action = Literal["build", "test", "run", "command", "generate", "daemon", "worker"]
 Bin = Literal["exe", "static"]
 
 
@@ -0,0 +1,328 @@
+"""Distributed compilation
+
+'pybuildc worker' compiles preprocessed sources for other machines. Builds
+started with '--workers' preprocess every source locally with the flags of
+'Compiler.compile_obj', send the result to the least busy worker and write
+the object file it sends back. Workers need neither the sources nor the
+headers of the project, only the same compiler version.
+
+Every message is a frame of a json header and a binary payload:
+
+    <uint32 header size> <uint32 payload size> <header> <payload>
+
+After connecting, the worker sends its protocol version, job count and
+compiler versions. Every request is then answered on the same connection,
+so the connections are kept open for the whole build.
+"""
+from collections.abc import Iterator, MutableMapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache
+import json
+import os
+from pathlib import Path
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+
+from pybuildc.compiler import Compiler
+from pybuildc.jobs import jobs_call, jobs_run, jobs_wait
+from pybuildc.tools import tool_find
+
+PROTOCOL = 1
+PORT = 3633
+# Seconds to wait for a worker to accept a connection
+CONNECT_TIMEOUT = 5.0
+# Seconds to wait for the answer of a worker, compiling a source included
+RESPONSE_TIMEOUT = 300.0
+# Failures in a row after which a worker is not used for the rest of the build
+MAX_FAILURES = 3
+
+_FRAME = struct.Struct("<II")
+# Everything a broken connection or a garbled message raises
+_ERRORS = (OSError, ValueError, struct.error)
+
+
+def _send(conn: socket.socket, header: dict, payload: bytes = b"") -> None:
+    data = json.dumps(header).encode()
+    conn.sendall(_FRAME.pack(len(data), len(payload)) + data)
+    if payload:
+        conn.sendall(payload)
+
+
+def _recv_exact(conn: socket.socket, size: int) -> bytes:
+    data = bytearray(size)
+    view = memoryview(data)
+    pos = 0
+    while pos < size:
+        n = conn.recv_into(view[pos:])
+        if not n:
+            raise ConnectionError("connection closed")
+        pos += n
+    return bytes(data)
+
+
+def _recv(conn: socket.socket) -> tuple[dict, bytes]:
+    size, payload = _FRAME.unpack(_recv_exact(conn, _FRAME.size))
+    return json.loads(_recv_exact(conn, size)), _recv_exact(conn, payload)
+
+
+@cache
+def _compiler_version(cc: str) -> str | None:
+    """First line of '--version', objects of other versions are not used"""
+    if not tool_find(cc):
+        return None
+    out = subprocess.run((cc, "--version"), capture_output=True, text=True).stdout
+    return out.splitlines()[0] if out else ""
+
+
+def _compile(request: dict, source: bytes) -> tuple[dict, bytes]:
+    """Compiles the source and returns the output of the compiler and the object"""
+    with tempfile.TemporaryDirectory(prefix="pybuildc-worker-") as tmp:
+        src = Path(tmp) / "source.i"
+        obj = Path(tmp) / "source.o"
+        src.write_bytes(source)
+        with (Path(tmp) / "stderr").open("w+b") as stderr:
+            try:
+                jobs_call(
+                    (
+                        request["cc"],
+                        *request["cflags"],
+                        # Debug info points to the build directory of the client
+                        f"-fdebug-prefix-map={tmp}={request['directory']}",
+                        "-o",
+                        str(obj),
+                        "-c",
+                        str(src),
+                    ),
+                    check=True,
+                    cwd=tmp,
+                    stdin=subprocess.DEVNULL,
+                    stderr=stderr,
+                )
+                returncode = 0
+            except subprocess.CalledProcessError as e:
+                returncode = e.returncode
+            stderr.seek(0)
+            output = stderr.read()
+        data = obj.read_bytes() if returncode == 0 else b""
+    return {"returncode": returncode, "stderr": len(output)}, output + data
+
+
+def _serve(conn: socket.socket, hello: dict) -> None:
+    with conn:
+        _send(conn, hello)
+        while True:
+            try:
+                request, source = _recv(conn)
+            except _ERRORS:
+                return
+            if request.get("cc") not in hello["compilers"]:
+                error = f"[pybuildc] worker has no compiler '{request.get('cc')}'\n"
+                response = {"returncode": 1, "stderr": len(error)}, error.encode()
+            else:
+                response = _compile(request, source)
+            try:
+                _send(conn, *response)
+            except OSError:
+                return
+
+
+def worker_serve(host: str, port: int | None, jobs: int | None) -> None:
+    """Compiles for clients until interrupted, every client gets a thread"""
+    jobs = jobs or os.cpu_count() or 1
+    compilers = {
+        cc: version
+        for cc in ("gcc", "clang")
+        if (version := _compiler_version(cc)) is not None
+    }
+    if not compilers:
+        raise Exception("No compiler found: install 'gcc' or 'clang'")
+    hello = {"protocol": PROTOCOL, "jobs": jobs, "compilers": compilers}
+
+    with socket.create_server((host, PORT if port is None else port)) as server:
+        host, port = server.getsockname()[:2]
+        print(f"[pybuildc] worker on {host}:{port} ({jobs} jobs)", flush=True)
+        try:
+            while True:
+                conn, _ = server.accept()
+                threading.Thread(target=_serve, args=(conn, hello), daemon=True).start()
+        except KeyboardInterrupt:
+            pass
+
+
+class Worker:
+    """A worker and the connections to it that are not in use"""
+
+    def __init__(self, address: str):
+        host, _, port = address.rpartition(":")
+        self.address = (host, int(port)) if host else (address, PORT)
+        # Until it said otherwise a worker takes one job at a time
+        self.jobs = 1
+        self.running = 0
+        self.failures = 0
+        self.idle: list[socket.socket] = []
+        self.connected = False
+
+    def __str__(self) -> str:
+        return "%s:%d" % self.address
+
+    def connect(self, cc: str) -> socket.socket:
+        try:
+            return self.idle.pop()
+        except IndexError:
+            pass
+        conn = socket.create_connection(self.address, CONNECT_TIMEOUT)
+        try:
+            conn.settimeout(RESPONSE_TIMEOUT)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            hello, _ = _recv(conn)
+            if hello.get("protocol") != PROTOCOL:
+                raise ConnectionError(f"worker '{self}' speaks another protocol")
+            if hello.get("compilers", {}).get(cc) != _compiler_version(cc):
+                raise ConnectionError(f"worker '{self}' has another version of '{cc}'")
+        except BaseException:
+            conn.close()
+            raise
+        with _workers_changed:
+            self.jobs = max(1, int(hello.get("jobs", 1)))
+            self.connected = True
+            _workers_changed.notify_all()
+        return conn
+
+    def probe(self, cc: str) -> None:
+        """Connects once to learn the job count, unreachable workers are skipped"""
+        try:
+            self.idle.append(self.connect(cc))
+        except _ERRORS as e:
+            self.failures = MAX_FAILURES
+            print(f"[pybuildc] worker '{self}' is not used: {e}")
+
+
+_workers: list[Worker] = []
+_workers_changed = threading.Condition()
+
+
+def workers_init(workers: list[str]) -> None:
+    """Sets the workers used by every context and dependency of this process"""
+    global _workers
+    for worker in _workers:
+        for conn in worker.idle:
+            conn.close()
+    _workers = [Worker(address) for address in workers]
+
+
+def _alive() -> bool:
+    with _workers_changed:
+        return any(w.failures < MAX_FAILURES for w in _workers)
+
+
+def _acquire() -> Worker | None:
+    """Waits for the least busy worker, None if no worker is left"""
+    with _workers_changed:
+        while True:
+            alive = [w for w in _workers if w.failures < MAX_FAILURES]
+            if not alive:
+                return None
+            free = [w for w in alive if w.running < w.jobs]
+            if free:
+                worker = min(free, key=lambda w: w.running / w.jobs)
+                worker.running += 1
+                return worker
+            _workers_changed.wait()
+
+
+def _release(worker: Worker, failed: bool) -> None:
+    with _workers_changed:
+        worker.running -= 1
+        worker.failures = worker.failures + 1 if failed else 0
+        _workers_changed.notify_all()
+
+
+def _compile_remote(cc: Compiler, src: Path, obj: Path) -> Path:
+    """Preprocesses locally, compiles on a worker and falls back to compiling here"""
+    if not _alive():
+        jobs_call(cc.compile_obj(src, obj), check=True)
+        return src
+
+    preprocessed = obj.with_suffix(".i")
+    jobs_call(cc.preprocess_obj(src, preprocessed), check=True)
+    try:
+        source = preprocessed.read_bytes()
+    finally:
+        preprocessed.unlink(missing_ok=True)
+    compiler, *cflags = cc.compile_preprocessed()
+    request = {"cc": compiler, "cflags": cflags, "directory": os.getcwd()}
+
+    while (worker := _acquire()) is not None:
+        try:
+            conn = worker.connect(compiler)
+        except _ERRORS as e:
+            _release(worker, True)
+            print(f"[pybuildc] worker '{worker}' failed: {e}")
+            continue
+        try:
+            _send(conn, request, source)
+            response, payload = _recv(conn)
+        except _ERRORS as e:
+            conn.close()
+            _release(worker, True)
+            print(f"[pybuildc] worker '{worker}' failed: {e}")
+            continue
+        worker.idle.append(conn)
+        _release(worker, False)
+
+        output = payload[: response["stderr"]]
+        if output:
+            sys.stderr.buffer.write(output)
+            sys.stderr.flush()
+        if response["returncode"]:
+            raise subprocess.CalledProcessError(
+                response["returncode"], cc.compile_obj(src, obj)
+            )
+        tmp = obj.with_name(f".{obj.name}.{threading.get_ident()}")
+        tmp.write_bytes(payload[response["stderr"] :])
+        os.replace(tmp, obj)
+        return src
+
+    jobs_call(cc.compile_obj(src, obj), check=True)
+    return src
+
+
+def workers_run(
+    cc: Compiler,
+    objects: Sequence[tuple[Path, Path]],
+    memory: MutableMapping[Path, int] | None = None,
+) -> Iterator[Path]:
+    """Compiles every (obj, src) and yields the sources as they finish
+
+    Without workers, or if none of them can be reached, this is 'jobs_run'
+    with the commands of 'compile_obj'.
+    Split debug info is compiled locally as well, the objects refer to their
+    .dwo files by the path they were compiled to.
+    There are twice as many threads as worker jobs, so the next sources are
+    already preprocessed and sent while the workers compile.
+    """
+    split = "-gsplit-dwarf" in cc.cflags
+    if _workers and not split:
+        compiler = cc.compile_preprocessed()[0]
+        with ThreadPoolExecutor(len(_workers)) as probes:
+            for worker in _workers:
+                if not worker.connected and worker.failures < MAX_FAILURES:
+                    probes.submit(worker.probe, compiler)
+    if split or not _alive():
+        yield from jobs_run(
+            tuple((src, cc.compile_obj(src, obj)) for obj, src in objects), memory
+        )
+        return
+
+    threads = 2 * sum(w.jobs for w in _workers if w.failures < MAX_FAILURES)
+    with ThreadPoolExecutor(threads) as executor:
+        yield from jobs_wait(
+            [
+                executor.submit(_compile_remote, cc, src, obj)
+                for obj, src in objects
+            ]
+        )
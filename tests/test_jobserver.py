@@ -0,0 +1,140 @@
+import os
+import threading
+
+import pytest
+
+from pybuildc.jobserver import Slots, _jobserver_client, jobserver_load
+
+
+@pytest.fixture
+def pipe():
+    read, write = os.pipe()
+    yield read, write
+    for fd in (read, write):
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+
+
+def test_no_jobserver():
+    assert _jobserver_client("") is None
+    assert _jobserver_client("-j4 -k") is None
+
+
+def test_pipe(pipe):
+    read, write = pipe
+    jobserver = _jobserver_client(f"-j4 --jobserver-auth={read},{write}")
+    assert jobserver is not None
+    assert jobserver.write == write
+    assert jobserver.fds == (read, write)
+    os.write(write, b"+")
+    assert jobserver.acquire() is None  # implicit token
+    assert jobserver.acquire() == b"+"
+    jobserver.close()
+
+
+def test_fds_of_old_make(pipe):
+    read, write = pipe
+    jobserver = _jobserver_client(f"-j4 --jobserver-fds={read},{write}")
+    assert jobserver is not None
+    assert jobserver.fds == (read, write)
+    jobserver.close()
+
+
+def test_last_auth_wins(pipe):
+    read, write = pipe
+    makeflags = f"--jobserver-auth=98,99 -j4 --jobserver-auth={read},{write}"
+    jobserver = _jobserver_client(makeflags)
+    assert jobserver is not None
+    assert jobserver.fds == (read, write)
+    jobserver.close()
+
+
+def test_closed_fds(pipe, capsys):
+    read, write = pipe
+    os.close(read)
+    os.close(write)
+    assert _jobserver_client(f"-j4 --jobserver-auth={read},{write}") is None
+    assert "prefix the make rule with '+'" in capsys.readouterr().out
+
+
+def test_fifo(tmp_path):
+    fifo = tmp_path / "jobserver"
+    os.mkfifo(fifo)
+    jobserver = _jobserver_client(f"-j2 --jobserver-auth=fifo:{fifo}")
+    assert jobserver is not None
+    assert jobserver.fds == ()
+    assert jobserver.read == jobserver.write
+    os.write(jobserver.write, b"+")
+    assert jobserver.acquire() is None
+    assert jobserver.acquire() == b"+"
+    jobserver.close()
+
+
+def test_missing_fifo(tmp_path):
+    assert _jobserver_client(f"--jobserver-auth=fifo:{tmp_path / 'none'}") is None
+
+
+def test_malformed():
+    assert _jobserver_client("--jobserver-auth=abc") is None
+
+
+def test_server(monkeypatch):
+    monkeypatch.setenv("MAKEFLAGS", "-j8 -k")
+    jobserver, jobs = jobserver_load(3)
+    assert jobs == 3
+    assert "-j8" not in jobserver.makeflags
+    read, write = jobserver.fds
+    assert jobserver.makeflags.endswith(f"-j3 --jobserver-auth={read},{write}")
+    jobserver.close()
+
+
+def test_client_limits_jobs(monkeypatch, pipe):
+    read, write = pipe
+    monkeypatch.setenv("MAKEFLAGS", f"-j2 --jobserver-auth={read},{write}")
+    _, jobs = jobserver_load(8)
+    assert jobs == 2
+
+
+def test_implicit_token_wakes_waiters(monkeypatch):
+    """A waiter must notice the implicit token coming back, with -j1 nothing else does"""
+    monkeypatch.delenv("MAKEFLAGS", raising=False)
+    jobserver, _ = jobserver_load(1)
+    token = jobserver.acquire()
+    acquired = threading.Event()
+
+    def wait():
+        jobserver.release(jobserver.acquire())
+        acquired.set()
+
+    thread = threading.Thread(target=wait, daemon=True)
+    thread.start()
+    assert not acquired.wait(0.1)
+    jobserver.release(token)
+    assert acquired.wait(5)
+    jobserver.close()
+
+
+def test_slots_without_posix(monkeypatch):
+    """Windows can not pass the pipes to the children, jobs are limited here only"""
+    monkeypatch.setattr(os, "name", "nt")
+    monkeypatch.setenv("MAKEFLAGS", "-j8")
+    slots, jobs = jobserver_load(2)
+    assert isinstance(slots, Slots)
+    assert jobs == 2
+    assert slots.makeflags is None
+    assert slots.fds == ()
+
+    tokens = [slots.acquire(), slots.acquire()]
+    acquired = threading.Event()
+
+    def wait():
+        slots.release(slots.acquire())
+        acquired.set()
+
+    threading.Thread(target=wait, daemon=True).start()
+    assert not acquired.wait(0.1)
+    slots.release(tokens.pop())
+    assert acquired.wait(5)
+    slots.close()
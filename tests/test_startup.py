@@ -0,0 +1,107 @@
+"""Startup budgets, measured on top of the startup of the interpreter itself"""
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+# Seconds pybuildc may add to the startup of the interpreter
+VERSION_BUDGET = 0.15
+NOOP_BUILD_BUDGET = 0.5
+RUNS = 5
+
+
+def _env(tmp_path: Path) -> dict[str, str]:
+    env = dict(os.environ, PYTHONPATH=str(ROOT), XDG_CACHE_HOME=str(tmp_path))
+    env.pop("MAKEFLAGS", None)
+    return env
+
+
+def _fastest(argv: list[str], env: dict[str, str], cwd: Path = ROOT) -> float:
+    fastest = float("inf")
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(argv, env=env, cwd=cwd, check=True, capture_output=True)
+        fastest = min(fastest, time.perf_counter() - start)
+    return fastest
+
+
+def _interpreter(env: dict[str, str]) -> float:
+    return _fastest([sys.executable, "-c", "pass"], env)
+
+
+def _imported(argv: list[str], env: dict[str, str]) -> set[str]:
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "pybuildc", *argv],
+        env=env,
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return {
+        line.split("|")[-1].strip()
+        for line in out.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+
+
+def _project(tmp_path: Path) -> Path:
+    project = tmp_path / "project"
+    (project / "src").mkdir(parents=True)
+    (project / "pybuildc.toml").write_text('[pybuildc]\nname = "project"\n')
+    (project / "src" / "project.c").write_text("int project(void) { return 0; }\n")
+    return project
+
+
+def test_version_imports_nothing_else(tmp_path: Path):
+    imported = _imported(["--version"], _env(tmp_path))
+    for module in (
+        "pybuildc.build",
+        "pybuildc.cache",
+        "pybuildc.compiler",
+        "pybuildc.context",
+        "tomllib",
+        "subprocess",
+        "json",
+    ):
+        assert module not in imported
+
+
+def test_version_budget(tmp_path: Path):
+    env = _env(tmp_path)
+    version = _fastest([sys.executable, "-m", "pybuildc", "--version"], env)
+    assert version - _interpreter(env) < VERSION_BUDGET
+
+
+@pytest.mark.skipif(
+    not (shutil.which("gcc") or shutil.which("clang")), reason="needs a compiler"
+)
+def test_noop_build_budget(tmp_path: Path):
+    project = _project(tmp_path)
+    env = _env(tmp_path)
+    build = [sys.executable, "-m", "pybuildc", "-d", str(project), "build"]
+    subprocess.run(build, env=env, check=True, capture_output=True)
+
+    cache = project / ".build" / "debug" / "cache"
+    commands = project / ".build" / "compile_commands.json"
+    mtimes = cache.stat().st_mtime_ns, commands.stat().st_mtime_ns
+
+    noop = _fastest(build, env)
+    assert noop - _interpreter(env) < NOOP_BUILD_BUDGET
+    # A build with nothing to do writes nothing
+    assert (cache.stat().st_mtime_ns, commands.stat().st_mtime_ns) == mtimes
+
+
+@pytest.mark.skipif(
+    not (shutil.which("gcc") or shutil.which("clang")), reason="needs a compiler"
+)
+def test_build_without_workers_imports_no_worker(tmp_path: Path):
+    imported = _imported(["-d", str(_project(tmp_path)), "build"], _env(tmp_path))
+    assert "pybuildc.build" in imported
+    for module in ("pybuildc.worker", "socket"):
+        assert module not in imported
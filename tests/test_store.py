@@ -0,0 +1,98 @@
+from pathlib import Path
+import struct
+
+import pytest
+
+from pybuildc import store
+from pybuildc.store import Store, store_load, store_save
+
+A = Path("/project/src/a.c")
+B = Path("/project/src/b.h")
+
+
+@pytest.fixture
+def cache(tmp_path: Path) -> Path:
+    filename = tmp_path / "cache"
+    store_save(
+        filename,
+        {A: (10, 1 << 63, ["b.h", "missing.h"]), B: (20, 42, [])},
+        {A: 2048},
+        {"build": {str(A): 1 << 63, str(B): 42}, "test": {str(A): 7}},
+    )
+    return filename
+
+
+def test_round_trip(cache: Path):
+    loaded = store_load(cache)
+    assert loaded.scan(A, 10) == (1 << 63, ["b.h", "missing.h"])
+    assert loaded.scan(B, 20) == (42, [])
+    assert loaded.peaks() == {A: 2048}
+    assert loaded.seen("build")[str(A)] == 1 << 63
+    assert loaded.seen("build")[str(B)] == 42
+    assert loaded.seen("test")[str(A)] == 7
+    assert loaded.seen("test")[str(B)] == 0
+    assert loaded.seen("run") == {}
+
+
+def test_changed_mtime(cache: Path):
+    loaded = store_load(cache)
+    assert loaded.scan(A, 11) is None
+    assert loaded.scan(Path("/project/src/c.c"), 10) is None
+
+
+def test_empty(tmp_path: Path):
+    filename = tmp_path / "cache"
+    store_save(filename, {}, {}, {})
+    loaded = store_load(filename)
+    assert loaded.paths == []
+    assert loaded.seen("build") == {}
+
+
+def test_missing(tmp_path: Path):
+    assert store_load(tmp_path / "cache").paths == []
+
+
+def _empty(loaded: Store) -> bool:
+    return loaded.paths == [] and loaded.actions == {} and loaded.peaks() == {}
+
+
+def test_other_version(cache: Path):
+    data = bytearray(cache.read_bytes())
+    struct.pack_into("<I", data, 4, store.VERSION + 1)
+    cache.write_bytes(data)
+    assert _empty(store_load(cache))
+
+
+def test_other_magic(cache: Path):
+    cache.write_bytes(b"XXXX" + cache.read_bytes()[4:])
+    assert _empty(store_load(cache))
+
+
+def test_other_byte_order(cache: Path):
+    data = bytearray(cache.read_bytes())
+    struct.pack_into("<I", data, 8, 1 - struct.unpack_from("<I", data, 8)[0])
+    cache.write_bytes(data)
+    assert _empty(store_load(cache))
+
+
+@pytest.mark.parametrize("size", [0, 3, 16, 40, 64, 100, -9, -1])
+def test_truncated(cache: Path, size: int):
+    cache.write_bytes(cache.read_bytes()[:size])
+    assert _empty(store_load(cache))
+
+
+def test_garbage(cache: Path):
+    cache.write_bytes(b"\xff" * 200)
+    assert _empty(store_load(cache))
+
+
+def test_pickled_cache(cache: Path):
+    # Caches of older versions were pickled dicts
+    cache.write_bytes(b"\x80\x04\x95\x0b\x00\x00\x00\x00\x00\x00\x00}\x94.")
+    assert _empty(store_load(cache))
+
+
+def test_atomic_write(cache: Path):
+    store_save(cache, {B: (1, 2, [])}, {}, {})
+    assert store_load(cache).scan(B, 1) == (2, [])
+    assert [p.name for p in cache.parent.iterdir()] == ["cache"]
@@ -0,0 +1,101 @@
+import re
+import shutil
+import socket
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from pybuildc import worker
+from pybuildc.args import args_parse
+from pybuildc.compiler import Compiler
+from pybuildc.context import contexts_load
+from pybuildc.worker import worker_serve, workers_init, workers_run
+
+pytestmark = pytest.mark.skipif(
+    not (shutil.which("gcc") or shutil.which("clang")), reason="needs a compiler"
+)
+
+SOURCES = 4
+
+
+@pytest.fixture
+def project(tmp_path: Path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    project = tmp_path / "project"
+    (project / "src").mkdir(parents=True)
+    (project / "pybuildc.toml").write_text('[pybuildc]\nname = "project"\n')
+    (project / "src" / "project.h").write_text("#define ANSWER 42\n")
+    for n in range(SOURCES):
+        (project / "src" / f"f{n}.c").write_text(
+            f'#include "project.h"\nint f{n}(void) {{ return ANSWER; }}\n'
+        )
+    args, _ = args_parse(["-d", str(project), "build"])
+    with contexts_load(args) as contexts:
+        yield Compiler(contexts[0]), contexts[0].files
+    workers_init([])
+
+
+@pytest.fixture
+def address(capsys) -> str:
+    """Serves a worker on a free port of localhost until the tests end"""
+    threading.Thread(
+        target=worker_serve, args=("127.0.0.1", 0, 2), daemon=True
+    ).start()
+    for _ in range(100):
+        match = re.search(r"worker on (\S+) ", capsys.readouterr().out)
+        if match:
+            return match[1]
+        time.sleep(0.05)
+    raise TimeoutError("worker did not start")
+
+
+def _objects(files) -> list[tuple[Path, Path]]:
+    return [(files.obj(src), src) for src in files.src_files]
+
+
+def test_compile_on_workers(project, address):
+    cc, files = project
+    workers_init([address, address])
+    objects = _objects(files)
+    assert sorted(workers_run(cc, objects)) == sorted(src for _, src in objects)
+    for obj, _ in objects:
+        assert obj.read_bytes().startswith(b"\x7fELF")
+    assert all(w.connected and w.failures == 0 for w in worker._workers)
+
+
+def test_dead_worker_compiles_locally(project, monkeypatch):
+    cc, files = project
+    with socket.create_server(("127.0.0.1", 0)) as server:
+        port = server.getsockname()[1]
+    workers_init([f"127.0.0.1:{port}"])
+
+    # All sources go to the shared pool at once instead of one at a time
+    run = []
+    jobs_run = worker.jobs_run
+
+    def spy(jobs, memory):
+        run.append(jobs)
+        return jobs_run(jobs, memory)
+
+    monkeypatch.setattr(worker, "jobs_run", spy)
+    objects = _objects(files)
+    assert len(list(workers_run(cc, objects))) == SOURCES
+    assert len(run) == 1 and len(run[0]) == SOURCES
+    for obj, _ in objects:
+        assert obj.read_bytes().startswith(b"\x7fELF")
+
+
+def test_fallback_skips_preprocessing(project, monkeypatch):
+    cc, files = project
+    workers_init(["127.0.0.1:1"])
+    worker._workers[0].failures = worker.MAX_FAILURES
+
+    def preprocess(src, out):
+        raise AssertionError("preprocessed for a local compile")
+
+    monkeypatch.setattr(cc, "preprocess_obj", preprocess)
+    obj, src = _objects(files)[0]
+    assert worker._compile_remote(cc, src, obj) == src
+    assert obj.read_bytes().startswith(b"\x7fELF")